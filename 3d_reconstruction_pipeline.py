@@ -4,12 +4,39 @@ import numpy as np
 from matplotlib import pyplot as plt
 from skimage import measure
 import trimesh
-import trimesh.repair
-import trimesh.smoothing
+from trimesh.exchange.gltf import export_glb
 import os
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+try:
+    from numba import njit, prange
+except ImportError:
+    # Numba is optional; compute_visual_hull falls back to the NumPy backend without it.
+    njit = None
+    prange = range
+try:
+    import cupy
+except ImportError:
+    # CuPy is optional; it is only needed for the GPU backend of compute_visual_hull.
+    cupy = None
+
+# Grayscale value above which a pixel is treated as background when extracting silhouettes.
+SILHOUETTE_THRESHOLD = 240
+
 # If running outside Colab, you might need to handle file uploads differently
 # from google.colab import files
 
+def _decode_grayscale(content):
+    """Decodes the bytes of an image file into a grayscale image, or None if decoding fails."""
+    return cv2.imdecode(np.frombuffer(content, np.uint8), cv2.IMREAD_GRAYSCALE)
+
+
+def _extract_silhouette(img_grayscale):
+    """Thresholds a grayscale image into a silhouette (object 255, background 0)."""
+    _, silhouette = cv2.threshold(img_grayscale, SILHOUETTE_THRESHOLD, 255, cv2.THRESH_BINARY_INV)
+    return silhouette
+
+
 def load_images(uploaded_files):
     """
     Loads grayscale images from uploaded files with error handling.
@@ -26,9 +53,12 @@ def load_images(uploaded_files):
         print("Warning: No files uploaded.")
         return images
     try:
-        for file_name, content in uploaded_files.items():
-            np_arr = np.frombuffer(content, np.uint8)
-            img_grayscale = cv2.imdecode(np_arr, cv2.IMREAD_GRAYSCALE)
+        # OpenCV releases the GIL while decoding, so the files are decoded concurrently;
+        # map keeps the results in upload order.
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            decoded_images = list(executor.map(_decode_grayscale, uploaded_files.values()))
+
+        for file_name, img_grayscale in zip(uploaded_files, decoded_images):
             if img_grayscale is None:
                 print(f"Error: Could not decode image file: {file_name}")
                 continue
@@ -59,13 +89,19 @@ def process_silhouettes(images, show_previews=False):
         print("No images provided for silhouette processing.")
         return silhouettes
     try:
+        valid_images = []
         for i, img_grayscale in enumerate(images):
             # Ensure image is valid before processing
             if img_grayscale is None or img_grayscale.size == 0:
                 print(f"Warning: Skipping processing for invalid image at index {i}.")
                 continue
+            valid_images.append((i, img_grayscale))
+
+        # cv2.threshold releases the GIL, so the images are thresholded concurrently
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            extracted = list(executor.map(_extract_silhouette, [img_grayscale for _, img_grayscale in valid_images]))
 
-            _, silhouette = cv2.threshold(img_grayscale, 240, 255, cv2.THRESH_BINARY_INV)
+        for (i, img_grayscale), silhouette in zip(valid_images, extracted):
             silhouettes.append(silhouette)
             if show_previews:
                 plt.figure(figsize=(10, 5))
@@ -89,86 +125,269 @@ def process_silhouettes(images, show_previews=False):
         return None
 
 
-def project_voxel_to_silhouette(voxel_coords, silhouette_shape, view_type, volume_bounds, grid_size):
-    """Projects a 3D voxel coordinate onto the 2D plane of a silhouette view."""
-    voxel_world_x = volume_bounds['x_min'] + (voxel_coords[0] + 0.5) * (volume_bounds['x_max'] - volume_bounds['x_min']) / grid_size
-    voxel_world_y = volume_bounds['y_min'] + (voxel_coords[1] + 0.5) * (volume_bounds['y_max'] - volume_bounds['y_min']) / grid_size
-    voxel_world_z = volume_bounds['z_min'] + (voxel_coords[2] + 0.5) * (volume_bounds['z_max'] - volume_bounds['z_min']) / grid_size
+def stack_silhouettes(silhouettes):
+    """
+    Packs a list of silhouettes into a single contiguous uint8 array.
+
+    Silhouettes of different sizes are zero-padded to the largest height and width
+    rather than resized, so each view still projects using its own shape.
+
+    Args:
+        silhouettes: A non-empty list of silhouette images.
+
+    Returns:
+        A tuple (silhouette_stack, shapes): a (V, H, W) uint8 array and the original
+        (height, width) of each silhouette.
+    """
+    shapes = [silhouette.shape for silhouette in silhouettes]
+    max_height = max(height for height, _ in shapes)
+    max_width = max(width for _, width in shapes)
+    silhouette_stack = np.zeros((len(silhouettes), max_height, max_width), dtype=np.uint8)
+    for v, silhouette in enumerate(silhouettes):
+        silhouette_stack[v, :silhouette.shape[0], :silhouette.shape[1]] = silhouette
+    return silhouette_stack, shapes
+
+
+# View types understood by the visual hull projection.
+VIEW_TYPES = ('front', 'side', 'top')
+
+# Edge length of the voxel blocks traversed by the Numba kernel; a 32^3 block and the
+# silhouette windows it projects to stay in cache while every view is folded in.
+CARVE_BLOCK_SIZE = 32
+
+
+# World-space layout of the voxel grid, computed once per run by compute_volume_geometry.
+VolumeGeometry = namedtuple('VolumeGeometry', ['grid_size', 'mins', 'maxs', 'spacing', 'voxel_centers'])
+
+
+def compute_volume_geometry(volume_bounds, grid_size):
+    """
+    Precomputes the world-space layout of the voxel grid.
+
+    Args:
+        volume_bounds: A dictionary defining the world coordinates bounds of the volume.
+        grid_size: The size of the voxel grid (cubic).
+
+    Returns:
+        A VolumeGeometry with the (x, y, z) minimum and maximum bounds and voxel spacing as
+        float64 arrays, and the voxel center coordinates along each axis.
+    """
+    mins = np.array([volume_bounds['x_min'], volume_bounds['y_min'], volume_bounds['z_min']], dtype=np.float64)
+    maxs = np.array([volume_bounds['x_max'], volume_bounds['y_max'], volume_bounds['z_max']], dtype=np.float64)
+    spacing = (maxs - mins) / grid_size
+    voxel_indices = np.arange(grid_size)
+    voxel_centers = tuple(mins[axis] + (voxel_indices + 0.5) * (maxs[axis] - mins[axis]) / grid_size for axis in range(3))
+    return VolumeGeometry(grid_size, mins, maxs, spacing, voxel_centers)
+
+
+def _as_volume_geometry(volume_bounds, grid_size):
+    """
+    Returns volume_bounds as a VolumeGeometry, computing it if a bounds dictionary is given.
+
+    Raises ValueError if a given VolumeGeometry was computed for a different grid_size.
+    """
+    if isinstance(volume_bounds, VolumeGeometry):
+        if volume_bounds.grid_size != grid_size:
+            raise ValueError(f"Volume geometry was computed for grid size {volume_bounds.grid_size}, not {grid_size}.")
+        return volume_bounds
+    return compute_volume_geometry(volume_bounds, grid_size)
+
+
+def _project_axis_lookups(silhouette_shape, view_type, geometry):
+    """
+    Projects the voxel centers of one view onto its silhouette, one axis at a time.
+
+    Each view type reads the silhouette row from one voxel axis and the column from
+    another, so the projection reduces to two 1-D lookup tables of pixel indices.
 
+    Returns:
+        A tuple (row_axis, rows, col_axis, cols), or None for an unknown view type.
+    """
+    world_x, world_y, world_z = geometry.voxel_centers
+    x_min, y_min, z_min = geometry.mins
+    x_max, y_max, z_max = geometry.maxs
     img_height, img_width = silhouette_shape
 
     if view_type == 'front':
-        proj_x = int((voxel_world_z - volume_bounds['z_min']) / (volume_bounds['z_max'] - volume_bounds['z_min']) * img_width)
-        proj_y = int((volume_bounds['y_max'] - voxel_world_y) / (volume_bounds['y_max'] - volume_bounds['y_min']) * img_height)
+        col_axis, cols = 2, (world_z - z_min) / (z_max - z_min) * img_width
+        row_axis, rows = 1, (y_max - world_y) / (y_max - y_min) * img_height
     elif view_type == 'side':
-        proj_x = int((voxel_world_x - volume_bounds['x_min']) / (volume_bounds['x_max'] - volume_bounds['x_min']) * img_width)
-        proj_y = int((volume_bounds['y_max'] - voxel_world_y) / (volume_bounds['y_max'] - volume_bounds['y_min']) * img_height)
+        col_axis, cols = 0, (world_x - x_min) / (x_max - x_min) * img_width
+        row_axis, rows = 1, (y_max - world_y) / (y_max - y_min) * img_height
     elif view_type == 'top':
-        proj_x = int((voxel_world_x - volume_bounds['x_min']) / (volume_bounds['x_max'] - volume_bounds['x_min']) * img_width)
-        proj_y = int((volume_bounds['z_max'] - voxel_world_z) / (volume_bounds['z_max'] - volume_bounds['z_min']) * img_height)
+        col_axis, cols = 0, (world_x - x_min) / (x_max - x_min) * img_width
+        row_axis, rows = 2, (z_max - world_z) / (z_max - z_min) * img_height
     else:
-        return None, None
+        return None
 
-    proj_x = max(0, min(proj_x, img_width - 1))
-    proj_y = max(0, min(proj_y, img_height - 1))
+    cols = np.clip(cols.astype(np.int32), 0, img_width - 1)
+    rows = np.clip(rows.astype(np.int32), 0, img_height - 1)
+    return row_axis, rows, col_axis, cols
 
-    return proj_y, proj_x
 
+def _carve_visual_hull_numpy(silhouette_stack, shapes, geometry, view_types, object_range, xp=np):
+    """
+    Carves the voxel grid with NumPy broadcasting, one vectorized pass per view.
 
-def compute_visual_hull(silhouettes, grid_size, volume_bounds, view_types, show_previews=False):
+    xp is the array module to carve with; passing cupy runs the same carve on the GPU,
+    with the silhouettes uploaded once and the grid copied back at the end.
+    """
+    grid_size = geometry.grid_size
+    silhouette_stack = xp.asarray(silhouette_stack)
+    # One bool per voxel; each view is AND-combined into it in a single pass.
+    occupied = xp.ones((grid_size, grid_size, grid_size), dtype=bool)
+
+    for v, view_type in enumerate(view_types):
+        row_axis, rows, col_axis, cols = _project_axis_lookups(shapes[v], view_type, geometry)
+
+        # Orient the lookup tables along their voxel axes so they broadcast
+        # against the (x, y, z) grid without materializing 3-D index arrays.
+        row_shape = [1, 1, 1]
+        row_shape[row_axis] = grid_size
+        col_shape = [1, 1, 1]
+        col_shape[col_axis] = grid_size
+
+        # If the projected pixel is outside the object's value range (background), the voxel is outside the object
+        projected = silhouette_stack[v, xp.asarray(rows.reshape(row_shape)), xp.asarray(cols.reshape(col_shape))]
+        occupied &= (projected >= object_range[0]) & (projected <= object_range[1])
+
+    if xp is not np:
+        occupied = xp.asnumpy(occupied)
+    return occupied
+
+
+def _carve_visual_hull_kernel(silhouette_stack, row_lookups, col_lookups, object_min, object_max,
+                              grid_size, block_size, occupied):
+    """Per-voxel carving loop, compiled with Numba and parallelized over grid blocks."""
+    blocks_per_axis = (grid_size + block_size - 1) // block_size
+    for block in prange(blocks_per_axis ** 3):
+        x0 = block // (blocks_per_axis * blocks_per_axis) * block_size
+        y0 = block // blocks_per_axis % blocks_per_axis * block_size
+        z0 = block % blocks_per_axis * block_size
+        for x in range(x0, min(x0 + block_size, grid_size)):
+            for y in range(y0, min(y0 + block_size, grid_size)):
+                for z in range(z0, min(z0 + block_size, grid_size)):
+                    # AND every view in unconditionally; an early exit per voxel is an
+                    # unpredictable branch that also blocks vectorization of this loop.
+                    inside = True
+                    for v in range(silhouette_stack.shape[0]):
+                        # Axes a view does not depend on hold zeros in its lookup tables.
+                        proj_y = row_lookups[v, 0, x] + row_lookups[v, 1, y] + row_lookups[v, 2, z]
+                        proj_x = col_lookups[v, 0, x] + col_lookups[v, 1, y] + col_lookups[v, 2, z]
+                        value = silhouette_stack[v, proj_y, proj_x]
+                        inside &= (value >= object_min) & (value <= object_max)
+                    occupied[x, y, z] = inside
+
+
+if njit is not None:
+    _carve_visual_hull_kernel = njit(parallel=True)(_carve_visual_hull_kernel)
+
+
+def _carve_visual_hull_numba(silhouette_stack, shapes, geometry, view_types, object_range):
+    """Carves the voxel grid with the Numba-compiled kernel."""
+    grid_size = geometry.grid_size
+
+    # Scatter each view's lookup tables into per-axis (V, 3, grid_size) tables.
+    row_lookups = np.zeros((len(view_types), 3, grid_size), dtype=np.int32)
+    col_lookups = np.zeros((len(view_types), 3, grid_size), dtype=np.int32)
+    for v, view_type in enumerate(view_types):
+        row_axis, rows, col_axis, cols = _project_axis_lookups(shapes[v], view_type, geometry)
+        row_lookups[v, row_axis] = rows
+        col_lookups[v, col_axis] = cols
+
+    occupied = np.empty((grid_size, grid_size, grid_size), dtype=bool)
+    _carve_visual_hull_kernel(silhouette_stack, row_lookups, col_lookups, object_range[0], object_range[1],
+                              grid_size, CARVE_BLOCK_SIZE, occupied)
+    return occupied
+
+
+def compute_visual_hull(silhouettes, grid_size, volume_bounds, view_types, show_previews=False, backend='numpy', threshold=None):
     """
     Computes the visual hull from a list of silhouettes with error handling
     and optionally displays voxel grid slices.
 
     Args:
-        silhouettes: A list of silhouette images.
+        silhouettes: A list of silhouette images, or of grayscale images if threshold is given.
         grid_size: The size of the voxel grid (cubic).
-        volume_bounds: A dictionary defining the world coordinates bounds of the volume.
+        volume_bounds: A dictionary defining the world coordinates bounds of the volume,
+                       or a VolumeGeometry from compute_volume_geometry.
         view_types: A list of strings indicating the view type for each silhouette.
         show_previews: If True, display slices of the resulting voxel grid.
+        backend: 'numpy' for the vectorized carve, 'numba' for the compiled parallel
+                 carve, or 'cupy' for the vectorized carve on a CUDA GPU (both fall back
+                 to 'numpy' if Numba or CuPy is not installed).
+        threshold: If given, the inputs are grayscale images and pixels at or below this
+                   value are the object, as with process_silhouettes. The threshold is then
+                   applied only to the projected pixels instead of whole images.
 
     Returns:
-        A numpy array representing the voxel grid, or None if an error occurs.
+        A tuple (voxel_grid, n_occupied): a boolean numpy array representing the voxel grid
+        (True for occupied voxels) and its number of occupied voxels, or (None, 0) if an
+        error occurs.
     """
     print("Computing visual hull...")
     if not silhouettes:
         print("No silhouettes provided for visual hull computation.")
-        return np.zeros((grid_size, grid_size, grid_size), dtype=np.uint8) # Return empty grid
+        return np.zeros((grid_size, grid_size, grid_size), dtype=bool), 0 # Return empty grid
 
     if len(silhouettes) != len(view_types):
         print(f"Error: Number of silhouettes ({len(silhouettes)}) does not match number of view types ({len(view_types)}).")
-        return None # Indicate failure
+        return None, 0 # Indicate failure
+
+    if backend not in ('numpy', 'numba', 'cupy'):
+        print(f"Error: Unknown visual hull backend '{backend}'. Expected 'numpy', 'numba' or 'cupy'.")
+        return None, 0
 
-    voxel_grid = np.full((grid_size, grid_size, grid_size), 255, dtype=np.uint8)
+    if backend == 'numba' and njit is None:
+        print("Warning: Numba is not installed. Falling back to the NumPy backend.")
+        backend = 'numpy'
+
+    if backend == 'cupy' and cupy is None:
+        print("Warning: CuPy is not installed. Falling back to the NumPy backend.")
+        backend = 'numpy'
 
     try:
-        for x in range(grid_size):
-            for y in range(grid_size):
-                for z in range(grid_size):
-                    if voxel_grid[x, y, z] == 0:
-                        continue
-
-                    for i, silhouette in enumerate(silhouettes):
-                        view_type = view_types[i]
-                        # Check for valid silhouette before projection
-                        if silhouette is None or silhouette.size == 0:
-                            print(f"Warning: Skipping visual hull computation for invalid silhouette at index {i}.")
-                            continue
-
-                        proj_y, proj_x = project_voxel_to_silhouette((x, y, z), silhouette.shape, view_type, volume_bounds, grid_size)
-
-                        if proj_y is not None and proj_x is not None:
-                            # Assuming silhouette has object as 255 and background as 0
-                            # If projected point is in the black background (0), the voxel is outside the object
-                            if silhouette[proj_y, proj_x] == 0:
-                                voxel_grid[x, y, z] = 0 # Mark voxel as empty
-                                break # No need to check other silhouettes for this voxel
-
-        print("Visual hull computation complete.")
-
-        if show_previews and np.sum(voxel_grid > 0) > 0:
-            print("
-Displaying slices of the voxel grid:")
+        geometry = _as_volume_geometry(volume_bounds, grid_size)
+        if not np.all(geometry.maxs > geometry.mins):
+            print(f"Error: Volume bounds must satisfy min < max on every axis, got mins {geometry.mins.tolist()} "
+                  f"and maxs {geometry.maxs.tolist()}.")
+            return None, 0
+
+        valid_silhouettes = []
+        valid_view_types = []
+        for i, silhouette in enumerate(silhouettes):
+            # Check for valid silhouette before projection
+            if silhouette is None or silhouette.size == 0:
+                print(f"Warning: Skipping visual hull computation for invalid silhouette at index {i}.")
+                continue
+            # Views without a known projection do not constrain the hull
+            if view_types[i] not in VIEW_TYPES:
+                continue
+            valid_silhouettes.append(silhouette)
+            valid_view_types.append(view_types[i])
+
+        if not valid_silhouettes:
+            voxel_grid = np.ones((grid_size, grid_size, grid_size), dtype=bool)
+        else:
+            # Carve from one contiguous (V, H, W) array instead of separately allocated images
+            silhouette_stack, shapes = stack_silhouettes(valid_silhouettes)
+            # Pixel values belonging to the object: nonzero in a silhouette, or at most
+            # the threshold in a grayscale image (cv2.THRESH_BINARY_INV semantics).
+            object_range = (1, 255) if threshold is None else (0, threshold)
+            if backend == 'numba':
+                voxel_grid = _carve_visual_hull_numba(silhouette_stack, shapes, geometry, valid_view_types, object_range)
+            elif backend == 'cupy':
+                voxel_grid = _carve_visual_hull_numpy(silhouette_stack, shapes, geometry, valid_view_types, object_range, xp=cupy)
+            else:
+                voxel_grid = _carve_visual_hull_numpy(silhouette_stack, shapes, geometry, valid_view_types, object_range)
+
+        # Count the occupied voxels once; callers reuse it instead of rescanning the grid
+        n_occupied = int(np.count_nonzero(voxel_grid))
+
+        print(f"Visual hull computation complete. {n_occupied} of {voxel_grid.size} voxels occupied.")
+
+        if show_previews and n_occupied > 0:
+            print("\nDisplaying slices of the voxel grid:")
             fig, axes = plt.subplots(1, 3, figsize=(15, 5))
 
             # Display a slice along the XZ plane (fixing Y)
@@ -194,26 +413,45 @@ Displaying slices of the voxel grid:")
 
             plt.tight_layout()
             plt.show()
-        elif show_previews and np.sum(voxel_grid > 0) == 0:
-            print("
-Voxel grid is empty, cannot display slices.")
+        elif show_previews and n_occupied == 0:
+            print("\nVoxel grid is empty, cannot display slices.")
 
-        return voxel_grid
+        return voxel_grid, n_occupied
     except Exception as e:
         print(f"An error occurred during visual hull computation: {e}")
-        return None
+        return None, 0
+
 
+def _occupied_bounding_box(voxel_grid):
+    """
+    Returns the (lower, upper) voxel index bounds of the occupied region, widened by
+    one empty voxel on each side (within the grid) so the surface around it is kept.
+    """
+    # Two passes over the grid: one collapsing x for the y/z extents, one for x itself
+    occupied_x = np.flatnonzero(voxel_grid.reshape(voxel_grid.shape[0], -1).any(axis=1))
+    occupied_yz = voxel_grid.any(axis=0)
+    occupied_y = np.flatnonzero(occupied_yz.any(axis=1))
+    occupied_z = np.flatnonzero(occupied_yz.any(axis=0))
+
+    extents = (occupied_x, occupied_y, occupied_z)
+    lower = tuple(max(int(indices[0]) - 1, 0) for indices in extents)
+    upper = tuple(min(int(indices[-1]) + 2, size) for indices, size in zip(extents, voxel_grid.shape))
+    return lower, upper
 
-def generate_mesh(voxel_grid, volume_bounds, grid_size, level=127):
+
+def generate_mesh(voxel_grid, volume_bounds, grid_size, level=0.5, n_occupied=None):
     """
     Generates a mesh from a voxel grid using Marching Cubes with error handling
     and checks for uniform volume.
 
     Args:
-        voxel_grid: A numpy array representing the voxel grid (uint8, 0 or 255).
-        volume_bounds: A dictionary defining the world coordinates bounds of the volume.
+        voxel_grid: A boolean numpy array representing the voxel grid.
+        volume_bounds: A dictionary defining the world coordinates bounds of the volume,
+                       or a VolumeGeometry from compute_volume_geometry.
         grid_size: The size of the voxel grid (cubic).
         level: The iso-surface value for Marching Cubes.
+        n_occupied: The number of occupied voxels, as returned by compute_visual_hull.
+                    If given, the uniform-volume check uses it instead of scanning the grid.
 
     Returns:
         A trimesh object or None if mesh generation fails.
@@ -223,50 +461,55 @@ def generate_mesh(voxel_grid, volume_bounds, grid_size, level=127):
         print("No valid voxel grid provided for mesh generation.")
         return None
 
-    # Step 1: Verificar o Volume - Check if there is a surface to extract
-    # Check if the grid is all 0s or all 255s
-    if np.all(voxel_grid == 0) or np.all(voxel_grid == 255):
-        print("ERROR: The voxel volume is uniform (all empty or all occupied). There is no surface to extract.")
+    # Spacing comes from the volume geometry (bounds divided by grid_size).
+    try:
+        geometry = _as_volume_geometry(volume_bounds, grid_size)
+    except (KeyError, ValueError) as e:
+        print(f"Error: Invalid volume bounds for mesh generation: {e}")
         return None
 
-    # Check if there are any occupied voxels before generating mesh
-    if np.sum(voxel_grid > 0) == 0:
-        print("Visual hull computation resulted in an empty grid. No mesh can be generated.")
+    # Step 1: Verificar o Volume - Check if there is a surface to extract
+    # Check if the grid is all empty or all occupied, reusing the occupied count when available
+    if n_occupied is not None:
+        is_uniform = n_occupied == 0 or n_occupied == voxel_grid.size
+    else:
+        # any()/all() stop at the first differing voxel
+        is_uniform = not voxel_grid.any() or voxel_grid.all()
+    if is_uniform:
+        print("ERROR: The voxel volume is uniform (all empty or all occupied). There is no surface to extract.")
         return None
 
     try:
-        # Step 2: Converter para Float
-        # Convert the voxel grid to float to ensure level works as expected
-        voxel_grid_float = voxel_grid.astype(np.float64)
-
-        # Step 3: Definir o Level (using 127 for float data as a standard midpoint)
-        # Calculate spacing based on the volume_bounds and grid_size.
-        spacing = ((volume_bounds['x_max'] - volume_bounds['x_min']) / grid_size,
-                   (volume_bounds['y_max'] - volume_bounds['y_min']) / grid_size,
-                   (volume_bounds['z_max'] - volume_bounds['z_min']) / grid_size)
+        # Only the occupied region can contain the surface, so crop the grid to its
+        # bounding box before Marching Cubes.
+        lower, upper = _occupied_bounding_box(voxel_grid)
+        cropped_grid = voxel_grid[lower[0]:upper[0], lower[1]:upper[1], lower[2]:upper[2]]
+
+        # Step 2: Definir o Level (using 0.5 as the midpoint between empty and occupied)
+        spacing = tuple(geometry.spacing.tolist())
         print(f"Using spacing for Marching Cubes: {spacing}")
 
 
         vertices, faces, normals, values = measure.marching_cubes(
-            volume=voxel_grid_float,
-            level=level, # Using level=127 with float data
+            volume=cropped_grid,
+            level=level, # 0.5 sits between empty (False) and occupied (True) voxels
             spacing=spacing
         )
 
-        # Vertices are scaled by spacing, so they are in world units relative to the volume's local origin (0,0,0 voxel index).
+        # Vertices are scaled by spacing, so they are in world units relative to the cropped region's origin.
         # To get them into world coordinates relative to the overall world origin (0,0,0),
-        # we need to add the minimum bounds of the volume.
-        vertices_world = vertices + np.array([volume_bounds['x_min'], volume_bounds['y_min'], volume_bounds['z_min']])
+        # we need to add the crop offset and the minimum bounds of the volume.
+        vertices_world = vertices + np.array(lower) * geometry.spacing + geometry.mins
 
 
         mesh = trimesh.Trimesh(vertices=vertices_world, faces=faces, vertex_normals=normals) # Use vertices_world
         print(f"Marching Cubes concluded. Generated mesh with {len(vertices_world)} vertices and {len(faces)} faces.")
         return mesh
     except ValueError as ve:
-         print(f"Error during mesh generation (ValueError) with level={level} on float data: {ve}. This might be due to the 'level' parameter not being within the data range or other input issues.")
+         print(f"Error during mesh generation (ValueError) with level={level}: {ve}. This might be due to the 'level' parameter not being within the data range or other input issues.")
          return None
     except Exception as e:
-        print(f"An unexpected error occurred during mesh generation with level={level} on float data: {e}")
+        print(f"An unexpected error occurred during mesh generation with level={level}: {e}")
         return None
 
 
@@ -276,14 +519,22 @@ def export_mesh(mesh, output_filename):
 
     Args:
         mesh: A trimesh object.
-        output_filename: The name of the output GLB file.
+        output_filename: The name of the output GLB file. A name ending in '.ply' writes
+                         a binary PLY instead, which is much faster to serialize for large meshes.
     """
     print(f"Exporting mesh to {output_filename}...")
     if mesh is not None:
         try:
             # Ensure the mesh has valid geometry before exporting
             if len(mesh.vertices) > 0 and len(mesh.faces) > 0:
-                mesh.export(output_filename)
+                if os.path.splitext(output_filename)[1].lower() == '.ply':
+                    mesh.export(output_filename, file_type='ply', encoding='binary')
+                else:
+                    # Serialize with the GLB exporter directly rather than through
+                    # mesh.export's file-type dispatch, and write the bytes in one go.
+                    glb_data = export_glb(mesh, include_normals=True)
+                    with open(output_filename, 'wb') as glb_file:
+                        glb_file.write(glb_data)
                 print(f"Successfully exported mesh to {output_filename}")
             else:
                 print("Warning: Mesh has no vertices or faces, skipping export.")
@@ -293,7 +544,7 @@ def export_mesh(mesh, output_filename):
         print("No mesh object available for export.")
 
 
-def run_reconstruction_pipeline(uploaded_files, view_types, grid_size=100, volume_bounds=None, marching_cubes_level=127, show_previews=True):
+def run_reconstruction_pipeline(uploaded_files, view_types, grid_size=100, volume_bounds=None, marching_cubes_level=0.5, show_previews=True):
     """
     Orchestrates the 3D reconstruction pipeline with configurable options and error handling.
 
@@ -320,59 +571,65 @@ def run_reconstruction_pipeline(uploaded_files, view_types, grid_size=100, volum
     print(f"Using Marching Cubes level: {marching_cubes_level}")
     print(f"Show previews: {show_previews}")
 
+    # Derive the grid's world-space layout once and share it between the pipeline stages
+    try:
+        geometry = compute_volume_geometry(volume_bounds, grid_size)
+    except KeyError as e:
+        print(f"Error: Volume bounds are missing the {e} key. Aborting pipeline.")
+        return
 
     # Step 1: Load images
-    print("
-Step 1: Loading images...")
+    print("\nStep 1: Loading images...")
     images = load_images(uploaded_files)
     if images is None or not images:
         print("Image loading failed or no images loaded. Aborting pipeline.")
         return
 
     # Step 2: Process silhouettes
-    print("
-Step 2: Processing silhouettes...")
-    silhouettes = process_silhouettes(images, show_previews=show_previews)
-    if silhouettes is None or not silhouettes:
-        print("Silhouette processing failed or no silhouettes processed. Aborting pipeline.")
-        return
+    print("\nStep 2: Processing silhouettes...")
+    if show_previews:
+        # Silhouette images are only materialized for the previews; the visual hull
+        # thresholds the grayscale images itself.
+        silhouettes = process_silhouettes(images, show_previews=show_previews)
+        if silhouettes is None or not silhouettes:
+            print("Silhouette processing failed or no silhouettes processed. Aborting pipeline.")
+            return
+    else:
+        print(f"Silhouettes will be thresholded at {SILHOUETTE_THRESHOLD} during visual hull computation.")
 
     # Check if the number of silhouettes matches the number of view types
-    if len(silhouettes) != len(view_types):
-        print(f"Error: Number of silhouettes ({len(silhouettes)}) does not match number of view types ({len(view_types)}). Aborting pipeline.")
+    if len(images) != len(view_types):
+        print(f"Error: Number of silhouettes ({len(images)}) does not match number of view types ({len(view_types)}). Aborting pipeline.")
         return
 
     # Step 3: Compute visual hull
-    print("
-Step 3: Computing visual hull...")
-    voxel_grid = compute_visual_hull(silhouettes, grid_size, volume_bounds, view_types, show_previews=show_previews)
+    print("\nStep 3: Computing visual hull...")
+    voxel_grid, n_occupied = compute_visual_hull(images, grid_size, geometry, view_types, show_previews=show_previews,
+                                                 threshold=SILHOUETTE_THRESHOLD)
     # Check if the visual hull computation returned a valid grid
     if voxel_grid is None or voxel_grid.shape != (grid_size, grid_size, grid_size):
          print("Visual hull computation failed or returned an invalid grid. Aborting pipeline.")
          return
 
     # Check if there are any occupied voxels before generating mesh
-    if np.sum(voxel_grid > 0) == 0:
+    if n_occupied == 0:
         print("Visual hull computation resulted in an empty grid. No mesh can be generated. Aborting pipeline.")
         return
 
     # Step 4: Generate mesh using Marching Cubes
-    print("
-Step 4: Generating mesh...")
-    # Pass volume_bounds and grid_size to generate_mesh
-    reconstructed_mesh = generate_mesh(voxel_grid, volume_bounds, grid_size, level=marching_cubes_level)
+    print("\nStep 4: Generating mesh...")
+    # Pass the volume geometry and grid_size to generate_mesh
+    reconstructed_mesh = generate_mesh(voxel_grid, geometry, grid_size, level=marching_cubes_level, n_occupied=n_occupied)
     if reconstructed_mesh is None:
         print("Mesh generation failed. Aborting pipeline.")
         return
 
     # Step 5: Export the GLB file
-    print("
-Step 5: Exporting GLB file...")
+    print("\nStep 5: Exporting GLB file...")
     output_filename = 'reconstructed_model.glb'
     export_mesh(reconstructed_mesh, output_filename)
 
-    print("
---- 3D Reconstruction Pipeline Complete ---")
+    print("\n--- 3D Reconstruction Pipeline Complete ---")
 
 # Example usage (will be placed in a separate cell):
 # if 'uploaded_files' in locals() and uploaded_files: